@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+cohort inventory
+
+Tabla con un registro por sujeto y cohorte (shhs1, shhs2) que indica qué
+archivos existen (edf, staging, xml, fila en el archivo de variables), sus
+tamaños y la duración del edf leída del header. Se guarda en un csv y solo se
+reconstruye si alguna de las carpetas cambió, así la selección de registros
+no recorre el sistema de archivos en cada corrida.
+"""
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from edfHeader import readEdfHeader
+from subjectID import getSubjectID
+
+CSV_SEP = ','
+COHORTS = ['shhs1', 'shhs2']
+INVENTORY_FILE_NAME = 'inventory.csv'
+# archivos de cada registro: (carpeta, sufijo)
+RECORD_FILES = {
+    'edf': ('edfs', '.edf'),
+    'staging': ('annotations-staging', '-staging.csv'),
+    'xml': ('annotations-events-nsrr', '-nsrr.xml'),
+}
+INVENTORY_COLUMNS = ['cohort', 'fileID', 'subjectID'] + [
+    c for k in RECORD_FILES for c in [k, f'{k}Size']
+] + ['variables', 'edfDuration', 'signalLength']
+logger = logging.getLogger(__name__)
+
+
+def getVariablesFile(root_path, cohort):
+    return f'{root_path}/{cohort}-dataset-0.9.0.csv'
+
+
+def getRecordPaths(root_path, cohort):
+    '''
+    Carpetas de los archivos de cada registro y archivo de variables de la
+    cohorte: {'edf', 'staging', 'xml', 'variables'}
+    '''
+    paths = {
+        k: f'{root_path}/{folder}/{cohort}'
+        for k, (folder, _) in RECORD_FILES.items()
+    }
+    paths['variables'] = getVariablesFile(root_path, cohort)
+    return paths
+
+
+def getInventoryFile(root_path):
+    return f'{root_path}/{INVENTORY_FILE_NAME}'
+
+
+def scanFolder(folder, suffix):
+    '''
+    {fileID: tamaño en bytes} de los archivos de la carpeta con el sufijo
+    '''
+    if not os.path.isdir(folder):
+        return {}
+    return {
+        e.name[:-len(suffix)]: e.stat().st_size
+        for e in os.scandir(folder) if e.name.endswith(suffix)
+    }
+
+
+def scanCohort(root_path, cohort):
+    paths = getRecordPaths(root_path, cohort)
+    files = {
+        k: scanFolder(paths[k], suffix)
+        for k, (_, suffix) in RECORD_FILES.items()
+    }
+    variables_file = paths['variables']
+    if os.path.isfile(variables_file):
+        subjects = set(
+            pd.read_csv(variables_file, sep=CSV_SEP, usecols=[0]).iloc[:, 0])
+    else:
+        subjects = set()
+
+    fileIDs = sorted(set().union(*[f.keys() for f in files.values()]))
+    rows = []
+    for fileID in fileIDs:
+        row = {'cohort': cohort, 'fileID': fileID}
+        row['subjectID'] = getSubjectID(fileID)
+        for k, f in files.items():
+            row[k] = fileID in f
+            row[f'{k}Size'] = f.get(fileID, 0)
+        row['variables'] = row['subjectID'] in subjects
+        # duración del edf (segundos) y largo de la señal sin decodificar
+        row['edfDuration'] = np.nan
+        row['signalLength'] = np.nan
+        if row['edf']:
+            try:
+                header = readEdfHeader(f"{paths['edf']}/{fileID}.edf")
+                row['edfDuration'] = header['duration']
+                row['signalLength'] = header['signal_length']
+            except (ValueError, IndexError):
+                logger.error(f'file {fileID}: invalid edf header.')
+        rows.append(row)
+    return rows
+
+
+def isOutdated(root_path, inventory_file, cohorts):
+    '''
+    El inventario está desactualizado si alguna carpeta o archivo de
+    variables se modificó después de generarlo. Solo se miran los mtime de
+    las carpetas (cambian al agregar o borrar archivos): un archivo
+    sobreescrito en el lugar no se detecta, en ese caso usar rebuild=True.
+    '''
+    if not os.path.isfile(inventory_file):
+        return True
+    mtime = os.path.getmtime(inventory_file)
+    paths = [
+        p for c in cohorts for p in getRecordPaths(root_path, c).values()
+    ]
+    return any(
+        os.path.getmtime(p) > mtime for p in paths if os.path.exists(p))
+
+
+def buildInventory(root_path, inventory_file=None, cohorts=None):
+    if inventory_file is None:
+        inventory_file = getInventoryFile(root_path)
+    if cohorts is None:
+        cohorts = COHORTS
+    rows = []
+    for c in cohorts:
+        rows += scanCohort(root_path, c)
+    inventory = pd.DataFrame(rows, columns=INVENTORY_COLUMNS)
+    inventory.to_csv(inventory_file, sep=CSV_SEP, index=False)
+    return inventory
+
+
+def loadInventory(root_path, inventory_file=None, cohorts=None,
+                  rebuild=False):
+    '''
+    Lee el inventario del csv, lo reconstruye (todas las cohortes) si no
+    existe o está desactualizado. Devuelve solo las cohortes pedidas.
+    '''
+    if inventory_file is None:
+        inventory_file = getInventoryFile(root_path)
+    if cohorts is None:
+        cohorts = COHORTS
+    if rebuild or isOutdated(root_path, inventory_file, COHORTS):
+        inventory = buildInventory(root_path, inventory_file)
+    else:
+        inventory = pd.read_csv(inventory_file, sep=CSV_SEP)
+    return inventory[inventory['cohort'].isin(cohorts)]
+
+
+def selectRecords(inventory, cohort, required=('edf', 'staging', 'xml',
+                                               'variables')):
+    '''
+    fileIDs de la cohorte que tienen todos los archivos requeridos, los
+    incompletos se registran en el log.
+    '''
+    inventory = inventory[inventory['cohort'] == cohort]
+    complete = inventory[list(required)].all(axis=1)
+    for _, row in inventory[~complete].iterrows():
+        missing = [r for r in required if not row[r]]
+        logger.info(f"file {row['fileID']} not parsed, missing {missing}.")
+    return sorted(inventory.loc[complete, 'fileID'])
+
+
+if __name__ == "__main__":
+    ROOT_PATH = './data'
+    inventory = loadInventory(ROOT_PATH, rebuild=True)
+    print(inventory.groupby('cohort')[['edf', 'staging', 'xml',
+                                       'variables']].sum())
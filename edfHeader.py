@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+edf header
+
+Los edfs de SHHS vienen con la fecha de inicio en 00.00.00 y pyedflib no los
+puede leer. Se reemplaza la fecha por 01.01.85 escribiendo solo los 8 bytes
+de la fecha en el header (reemplaza a rewrite_signal_date.rb).
+También se leen del header la duración y el número de muestras de cada canal
+sin decodificar las señales. Este módulo no depende de ray, la corrección de
+toda una carpeta en paralelo está en fixEdfDates.py.
+"""
+
+import logging
+
+# posición de la fecha de inicio en el header (dd.mm.yy)
+START_DATE_OFFSET = 168
+START_DATE_SIZE = 8
+WRONG_DATE = b'00.00.00'
+CLIPPING_DATE = b'01.01.85'
+# header fijo: 256 bytes, luego 256 bytes por canal
+HEADER_SIZE = 256
+SIGNAL_HEADER_SIZE = 256
+logger = logging.getLogger(__name__)
+
+
+def readEdfHeader(fname):
+    '''
+    Lee del header el número de registros, la duración de cada registro, las
+    etiquetas de los canales y las muestras por registro de cada canal.
+    '''
+    with open(fname, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        ns = int(header[252:256])
+        signal_header = f.read(SIGNAL_HEADER_SIZE * ns)
+
+    def field(offset, size):
+        # los campos de cada canal están contiguos: size bytes por canal
+        return [
+            signal_header[offset + i * size:offset + (i + 1) * size].decode(
+                'ascii', 'ignore').strip() for i in range(ns)
+        ]
+
+    n_records = int(header[236:244])
+    record_duration = float(header[244:252])
+    samples_per_record = [int(n) for n in field(216 * ns, 8)]
+    return {
+        'n_records': n_records,
+        'record_duration': record_duration,
+        'duration': n_records * record_duration,
+        'labels': field(0, 16),
+        'samples_per_record': samples_per_record,
+        # parseSignalsEdf toma el largo del primer canal
+        'signal_length': n_records * samples_per_record[0],
+    }
+
+
+def fixEdfDate(fname):
+    '''
+    Corrige la fecha de inicio del edf si es WRONG_DATE. Devuelve True si el
+    archivo fue modificado.
+    '''
+    # solo se abre para escritura si la fecha está mal
+    with open(fname, 'rb') as f:
+        f.seek(START_DATE_OFFSET)
+        if f.read(START_DATE_SIZE) != WRONG_DATE:
+            return False
+    with open(fname, 'r+b') as f:
+        f.seek(START_DATE_OFFSET)
+        f.write(CLIPPING_DATE)
+    logger.info(f'{fname}: start date {WRONG_DATE.decode()} to '
+                f'{CLIPPING_DATE.decode()}')
+    return True
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+fix edf dates
+
+Corrige en paralelo (ray) la fecha de inicio de todos los edfs de una carpeta
+con fixEdfDate de edfHeader.
+"""
+
+import glob
+import logging
+
+import ray
+
+from edfHeader import fixEdfDate
+
+
+@ray.remote
+def fixEdfDateRemote(fname):
+    return fixEdfDate(fname)
+
+
+def fixEdfDates(edf_path):
+    '''
+    Corrige en paralelo todos los edfs de la carpeta. Devuelve la lista de
+    archivos modificados.
+    '''
+    files = sorted(glob.glob(f'{edf_path}/*.edf'))
+    fixed = ray.get([fixEdfDateRemote.remote(fn) for fn in files])
+    return [fn for fn, f in zip(files, fixed) if f]
+
+
+if __name__ == "__main__":
+    ROOT_PATH = './data'
+    EDF_PATH = f'{ROOT_PATH}/edfs/shhs1'
+    logging.basicConfig(level=logging.INFO)
+    ray.init(num_cpus=8)
+    fixed = fixEdfDates(EDF_PATH)
+    print(f'{len(fixed)} files fixed in {EDF_PATH}')
@@ -10,6 +10,8 @@ Variables can be seen in: https://sleepdata.org/datasets/shhs/variables
 import numpy as np
 import pandas as pd
 
+from subjectID import getSubjectID
+
 CSV_SEP = ','
 VARIABLES = [
     'HREMBP', 'HROP', 'HNRBP', 'HNROP', 'HREMBP3', 'HROP3', 'HNRBP3', 'HNROP3',
@@ -24,7 +26,7 @@ def buildVariablesFile(csv_file, signalID, df_in, calc_vars):
     new_row['fileName'] = signalID
 
     # get file ID (index in csv)
-    id = int(signalID.split('-')[1])
+    id = getSubjectID(signalID)
 
     # read file
     df = pd.read_csv(csv_file, sep=CSV_SEP, index_col=0)
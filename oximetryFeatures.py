@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+oximetry features
+
+Variables de oximetría calculadas sobre la SaO2 corregida (1 muestra por
+segundo):
+    odi{th}: desaturaciones >= th % por hora de sueño
+    t90: minutos de sueño con SaO2 < 90 %
+    spo2Nadir: SaO2 mínima durante el sueño
+    desatBurden: área de las desaturaciones (%·min) por hora de sueño
+La línea de base es el máximo de la SaO2 en la ventana previa, calculado en
+O(n) con máximos por bloques (van Herk/Gil-Werman). Los eventos se detectan
+por tramos consecutivos y se comparan con las desaturaciones del xml.
+"""
+
+import numpy as np
+
+from parseRespEvents import readXmlEvents
+
+ODI_THRESHOLDS = [3.0, 4.0]
+# ventana de la línea de base y duración mínima del evento (segundos)
+BASELINE_WINDOW = 120
+MIN_EVENT_DURATION = 10
+T90_LEVEL = 90
+
+
+def runningMax(x, window):
+    '''
+    Máximo de x en la ventana [t - window + 1, t], ignora NaN.
+    '''
+    n = x.size
+    # rellenar al inicio (ventana incompleta) y al final (bloques completos)
+    n_pad = -(n + window - 1) % window
+    xp = np.concatenate(
+        [np.full(window - 1, -np.inf), x, np.full(n_pad, -np.inf)])
+    blocks = xp.reshape(-1, window)
+    # máximo acumulado desde el inicio y desde el final de cada bloque
+    prefix = np.fmax.accumulate(blocks, axis=1).flatten()
+    suffix = np.fmax.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].flatten()
+    out = np.fmax(suffix[:n], prefix[window - 1:window - 1 + n])
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def getRuns(mask):
+    '''
+    (start, stop) de los tramos consecutivos donde mask es True
+    '''
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def runsMask(starts, stops, n):
+    '''
+    Máscara de largo n con los tramos (start, stop)
+    '''
+    mask = np.zeros(n + 1, dtype=int)
+    np.add.at(mask, starts, 1)
+    np.add.at(mask, stops, -1)
+    return np.cumsum(mask)[:-1] > 0
+
+
+def getDesatEvents(drop, threshold, sleep):
+    '''
+    Desaturaciones: caída respecto de la línea de base >= threshold durante
+    al menos MIN_EVENT_DURATION segundos, que comienzan durante el sueño
+    '''
+    starts, stops = getRuns(drop >= threshold)
+    keep = (stops - starts >= MIN_EVENT_DURATION) & sleep[starts]
+    return starts[keep], stops[keep]
+
+
+def getXmlDesaturations(xml_events, signal_length, threshold):
+    '''
+    (start, stop) de cada desaturación del xml con caída >= threshold, en su
+    posición original (sin el desplazamiento de getDesaturation) y sin unir
+    eventos contiguos
+    '''
+    desat = np.array([(s, s + d) for (ev_type, s, d, drop) in xml_events
+                      if 'SpO2 desaturation' in ev_type and drop >= threshold
+                      ]).reshape(-1, 2)
+    starts, stops = np.round(desat).astype(int).T
+    keep = starts < signal_length
+    return starts[keep], np.minimum(stops[keep], signal_length)
+
+
+def oximetryFeatures(SaO2, sleep, tst, xml_data=None, thresholds=None):
+    '''
+    Devuelve un diccionario con las variables de oximetría. sleep es la
+    máscara de sueño, tst el tiempo total de sueño en minutos. Si se pasa el
+    xml se agregan, para cada umbral, el índice de desaturaciones del xml
+    (odi{th}_xml) y la fracción de ellas detectadas (odi{th}_xmlAgreement).
+    '''
+    if thresholds is None:
+        thresholds = ODI_THRESHOLDS
+    SaO2 = np.asarray(SaO2)
+    sleep = np.asarray(sleep, dtype=bool)
+    # sin sueño los índices por hora no están definidos
+    sleep_hours = tst / 60 if tst > 0 else np.nan
+    features = {}
+
+    baseline = runningMax(SaO2, BASELINE_WINDOW)
+    drop = baseline - SaO2
+    if xml_data is not None:
+        xml_events = readXmlEvents(xml_data)
+
+    for th in thresholds:
+        name = f'odi{th:g}'
+        starts, stops = getDesatEvents(drop, th, sleep)
+        features[name] = starts.size / sleep_hours
+
+        if xml_data is not None:
+            # fracción de desaturaciones del xml que solapan un evento
+            events = np.concatenate(
+                ([0], np.cumsum(runsMask(starts, stops, SaO2.size))))
+            xml_starts, xml_stops = getXmlDesaturations(
+                xml_events, SaO2.size, th)
+            xml_sleep = sleep[xml_starts]
+            xml_starts, xml_stops = xml_starts[xml_sleep], xml_stops[xml_sleep]
+            matched = events[xml_stops] - events[xml_starts] > 0
+            features[f'{name}_xml'] = xml_starts.size / sleep_hours
+            features[f'{name}_xmlAgreement'] = (matched.mean()
+                                                if matched.size else np.nan)
+
+    features['t90'] = np.sum(SaO2[sleep] < T90_LEVEL) / 60
+    features['spo2Nadir'] = np.nanmin(SaO2[sleep]) if sleep.any() else np.nan
+    # área entre la línea de base y la SaO2 durante las desaturaciones
+    starts, stops = getDesatEvents(drop, min(thresholds), sleep)
+    in_event = runsMask(starts, stops, SaO2.size)
+    features['desatBurden'] = np.nansum(drop[in_event]) / 60 / sleep_hours
+
+    return features
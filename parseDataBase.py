@@ -3,7 +3,6 @@
 """
 SLEEP DATABASE PARSE
 """
-import glob
 import logging
 import os
 from datetime import datetime
@@ -15,11 +14,10 @@ import scipy.io as spio
 from matplotlib.pyplot import figure, plot
 from tqdm import tqdm
 
+from cohortInventory import getRecordPaths, loadInventory, selectRecords
 from makeVariablesFile import buildVariablesFile
-from parseRespEvents import parseRespEvents
-from parseSignalsEdf import parseSignalsEdf
-from parseSleepStages import parseSleepStages
-from parseVariables import parseVariables
+from recordGraph import buildRecordGraph, evaluateRecord, getRecordOutputs
+from recordTransport import RecordWriter, putRecord
 
 ray.shutdown()
 num_cpus = 8
@@ -27,14 +25,25 @@ ray.init(num_cpus=num_cpus)
 
 # ROOT_PATH = '/media/data/shhs'
 ROOT_PATH = "./data"
-EDF_PATH = f"{ROOT_PATH}/edfs/shhs1"
-SLEEP_STAGING_PATH = f"{ROOT_PATH}/annotations-staging/shhs1"
-NSRR_EVENTS_PATH = f"{ROOT_PATH}/annotations-events-nsrr/shhs1"
-VARIABLES_FILE = f"{ROOT_PATH}/shhs1-dataset-0.9.0.csv"
-MAT_OUT_PATH = f"{ROOT_PATH}/matlab/shhs1"
+COHORT = "shhs1"
+# carpetas de entrada de la cohorte, las mismas que usa el inventario
+RECORD_PATHS = getRecordPaths(ROOT_PATH, COHORT)
+EDF_PATH = RECORD_PATHS["edf"]
+SLEEP_STAGING_PATH = RECORD_PATHS["staging"]
+NSRR_EVENTS_PATH = RECORD_PATHS["xml"]
+VARIABLES_FILE = RECORD_PATHS["variables"]
+MAT_OUT_PATH = f"{ROOT_PATH}/matlab/{COHORT}"
 VARS_FILE_NAME = f"{MAT_OUT_PATH}/00_variables.csv"
 LENGTHS_FILE_NAME0 = f"{MAT_OUT_PATH}/00_allLengths.csv"
 LENGTHS_FILE_NAME1 = f"{MAT_OUT_PATH}/sequenceLengths.mat"
+# arrays de cada registro en .npy para leer con memmap (None para desactivar)
+NPY_OUT_PATH = f"{ROOT_PATH}/npy/{COHORT}"
+# arrays de todos los registros agregados en un solo almacenamiento, enviados
+# al escritor por memoria compartida. Reemplaza a los .mat y .npy de cada
+# registro, windowSampler lo lee con store=True (None para desactivar)
+STORE_OUT_PATH = None
+# cache de señales decodificadas (None para desactivar)
+SIGNALS_CACHE_PATH = f"{ROOT_PATH}/cache/{COHORT}"
 
 # crear folder de salida
 if not os.path.isdir(MAT_OUT_PATH):
@@ -105,6 +114,9 @@ RESP_EVENTS_MAPS = [
     },
 ]
 # ------
+# variables de oximetría (ODI, t90, nadir, burden), None para no calcularlas
+OXIMETRY_THRESHOLDS = [3.0, 4.0]
+# ------
 # Variables
 VARIABLES = ["ahi_a0h3", "ahi_a0h4", "SlpPrdP"]
 # ------
@@ -129,142 +141,139 @@ def write2mat(fname, out_data):
     spio.savemat(fname, out_data)
 
 
-def calc_ah_index(fname, signal_length, out_dict, th):
+def getRecordArrays(out_data):
 
-    AH_RESP_MAP = {
-        "targetName": "resp_ahi",
-        "maps": [
-            {"map": 1, "event": ["Hypopnea"], "SpO2 desaturation": th},
-            {
-                "map": 2,
-                "event": ["Obstructive apnea", "Central Apnea", "Mixed Apnea"],
-                "SpO2 desaturation": None,
-            },
-        ],
-    }
-    AH_SLEEP_MAP = {
-        "targetName": "sleep_ahi",
-        "map": {
-            "0": [0, 6],
-            "1": [1, 2, 3, 4, 5],
-        },
+    arrays = {
+        s: val
+        for s, val in out_data.items()
+        if isinstance(val, (np.ndarray)) and val.size > 1
     }
+    arrays["validSegments"] = out_data["validSegments"]
+    return arrays
 
-    od_, _ = parseSleepStages(
-        SLEEP_STAGING_PATH,
-        fname,
-        signal_length=signal_length,
-        out_dict={},
-        sleepStagesMaps=[AH_SLEEP_MAP],
-    )
-    od_ = parseRespEvents(
-        NSRR_EVENTS_PATH,
-        fname,
-        signal_length=signal_length,
-        out_dict=od_,
-        respEventsMaps=[AH_RESP_MAP],
-    )
 
-    # tst = od_['tst']
-    SlpPrd = out_dict["SlpPrdP"]
-    sleep_events = od_["sleep_ahi"]
-    ah_events = od_["resp_ahi"]
-    temp_ah_events = (ah_events > 0).astype(float)
+def write2npy(fname, out_data):
 
-    # remove awake and partially awake events
-    ev_diff = np.diff(temp_ah_events)
-    mark_points = np.diff(temp_ah_events * (1 - sleep_events)) * np.abs(ev_diff)
-    for i in np.where(mark_points == 1)[0]:
-        try:
-            j = np.where(ev_diff[i + 1 :] < 0)[0][0]
-            ah_events[i + 1 : i + 2 + j] = 0
-        except:
-            pass
+    out_path = f"{NPY_OUT_PATH}/{fname}"
+    os.makedirs(out_path, exist_ok=True)
+    for s, val in getRecordArrays(out_data).items():
+        np.save(f"{out_path}/{s}.npy", val)
 
-    out_dict["targetAH_th{th}_masked_sleep"] = ah_events * sleep_events
-    n_ah_events = (np.diff(ah_events * sleep_events) > 0).sum()
-    ahi = 60 * n_ah_events / (SlpPrd)
-    out_dict[f"cal_ahi_a0h{th}"] = ahi
 
-    return out_dict
+def getValidSegments(valid):
+    """
+    (start, stop) de cada tramo de muestras válidas, stop no incluido
+    """
+    edges = np.diff(np.concatenate(([0], valid.astype(np.int8), [0])))
+    return np.stack(
+        [np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)], axis=1
+    )
 
 
 def cropNans(out_dict):
-
-    iflag = True
-    for i, (s, val) in enumerate(out_dict.items()):
-        if isinstance(val, (np.ndarray)):
-            if iflag:
+    """
+    Recorta los NaN al inicio y al final con un slice (sin copiar) y guarda
+    en validSegments los tramos sin NaN, relativos a la señal recortada. Los
+    NaN interiores se mantienen para no desplazar la línea de tiempo.
+    """
+    nans = None
+    for s, val in out_dict.items():
+        # puede haber variables escalares en el diccionario (como tst)
+        if isinstance(val, (np.ndarray)) and val.size > 1:
+            if nans is None:
                 nans = np.isnan(val)
-                iflag = False
             else:
-                nans += np.isnan(val)
+                nans |= np.isnan(val)
+
+    segments = getValidSegments(~nans)
+    if segments.size > 0:
+        start, stop = segments[0, 0], segments[-1, 1]
+    else:
+        start, stop = 0, 0
 
     for s, val in out_dict.items():
-        # puede haber variables escalares en el diccionario (como tst)
-        if isinstance(val, (np.ndarray)):
-            if val.size > 1:
-                out_dict[s] = val[~nans]
-    return out_dict, np.sum(~nans)
+        if isinstance(val, (np.ndarray)) and val.size > 1:
+            out_dict[s] = val[start:stop]
+    out_dict["validSegments"] = segments - start
+    return out_dict, stop - start
 
 
-@ray.remote
-def parseFile(fname, var_df, lengths_array):
-    # logging.info(f'{fname}')
-    out_dict, sl = parseSignalsEdf(
-        EDF_PATH,
+def getRecordGraph(fname):
+    return buildRecordGraph(
         fname,
-        out_dict={"fileID": fname, "error": False},
+        paths={**RECORD_PATHS, "cache": SIGNALS_CACHE_PATH},
         signalsNames=SIGNALS_EDF_NAMES,
+        sleepStagesMaps=SLEEP_STAGES_MAPS,
+        respEventsMaps=RESP_EVENTS_MAPS,
+        variables=VARIABLES,
+        oximetryThresholds=OXIMETRY_THRESHOLDS,
     )
-    if not out_dict["error"]:
-        out_dict, _ = parseSleepStages(
-            SLEEP_STAGING_PATH,
-            fname,
-            signal_length=sl,
-            out_dict=out_dict,
-            sleepStagesMaps=SLEEP_STAGES_MAPS,
-        )
 
-        out_dict = parseRespEvents(
-            NSRR_EVENTS_PATH,
-            fname,
-            signal_length=sl,
-            out_dict=out_dict,
-            respEventsMaps=RESP_EVENTS_MAPS,
-        )
-        out_dict = parseVariables(
-            VARIABLES_FILE, signalID=fname, out_dict=out_dict, variables=VARIABLES
-        )
 
-        out_dict = calc_ah_index(fname, signal_length=sl, out_dict=out_dict, th=4)
-        out_dict = calc_ah_index(fname, signal_length=sl, out_dict=out_dict, th=3)
+@ray.remote
+def parseFile(fname, var_df, lengths_array):
+    descriptor = None
+    # logging.info(f'{fname}')
+    graph = getRecordGraph(fname)
+    memo = {}
+    signals = evaluateRecord(graph, ["signals"], memo)["signals"]
+    if not signals["error"]:
+        out_dict = {
+            "fileID": fname,
+            "sleepStagesTargetMaps": [str(map) for map in SLEEP_STAGES_MAPS],
+            "respEventTargetMaps": [str(map) for map in RESP_EVENTS_MAPS],
+        }
+        # todas las salidas, los intermedios (xml, staging) se calculan una vez
+        out_dict.update(evaluateRecord(graph, getRecordOutputs(graph), memo))
+        sl = memo["signalLength"]
 
         # crop trailing nans
         out_dict, crop_sl = cropNans(out_dict)
-        del out_dict["error"]
-        write2mat(fname, out_dict)
+        if STORE_OUT_PATH is None:
+            write2mat(fname, out_dict)
+            if NPY_OUT_PATH is not None:
+                write2npy(fname, out_dict)
 
         # variables file
         calc_vars = {
             "tst": out_dict["tst"],
             "cal_ahi_a0h3": out_dict["cal_ahi_a0h3"],
             "cal_ahi_a0h4": out_dict["cal_ahi_a0h4"],
+            **memo.get("oximetryFeatures", {}),
         }
         var_df = buildVariablesFile(
             VARIABLES_FILE, signalID=fname, df_in=var_df, calc_vars=calc_vars
         )
-        lengths_array.append((fname, sl, crop_sl))
-    return (var_df, lengths_array)
+        valid_sl = np.diff(out_dict["validSegments"], axis=1).sum()
+        lengths_array.append((fname, sl, crop_sl, valid_sl))
+
+        # al final: si algo falla antes el bloque no queda en /dev/shm
+        if STORE_OUT_PATH is not None:
+            descriptor = putRecord(fname, getRecordArrays(out_dict))
+    return (var_df, lengths_array, descriptor)
+
+
+def waitAppends(appends):
+    """
+    Espera las escrituras del escritor y devuelve los registros que fallaron
+    (quedan fuera de index.csv)
+    """
+    not_stored = []
+    for fn, ref in appends:
+        try:
+            ray.get(ref)
+        except Exception as e:
+            logging.error(f"file {fn} not stored: {e!r}")
+            not_stored.append(fn)
+    return not_stored
 
 
 def parseDataBase(fnames=None, n_start=None, nfiles=None, disableTqdm=False):
 
-    # read files name in folder
+    # registros completos según el inventario de la cohorte
     if fnames is None:
-        files = glob.glob(f"{EDF_PATH}/*.edf")
-        fnames = [fn.split("/")[-1] for fn in files]
-        fnames = [fn.split(".")[0] for fn in fnames]
+        inventory = loadInventory(ROOT_PATH, cohorts=[COHORT])
+        fnames = selectRecords(inventory, COHORT)
 
     if n_start is not None:
         fnames = fnames[n_start:]
@@ -276,23 +285,43 @@ def parseDataBase(fnames=None, n_start=None, nfiles=None, disableTqdm=False):
     fnames = sorted(fnames)
     var_df = pd.DataFrame()
     lengths_array = []
-    for fn in tqdm(fnames, disable=disableTqdm):
-        # var_df, lengths_array = parseFile(fn, var_df, lengths_array)
-        id = parseFile.remote(fn, var_df, lengths_array)
-        var_df = ray.get(id)[0]
-        lengths_array = ray.get(id)[1]
+    if STORE_OUT_PATH is not None:
+        writer = RecordWriter.remote(STORE_OUT_PATH)
+    appends = []
+    try:
+        for fn in tqdm(fnames, disable=disableTqdm):
+            # var_df, lengths_array = parseFile(fn, var_df, lengths_array)
+            id = parseFile.remote(fn, var_df, lengths_array)
+            var_df, lengths_array, descriptor = ray.get(id)
+            # el escritor recibe solo el descriptor, en el orden de los registros
+            if descriptor is not None:
+                appends.append((fn, writer.append.remote(descriptor)))
+    finally:
+        # escribir el índice aunque falle un registro
+        if STORE_OUT_PATH is not None:
+            not_stored = waitAppends(appends)
+            ray.get(writer.close.remote())
+    if STORE_OUT_PATH is not None and not_stored:
+        raise RuntimeError(
+            f"{len(not_stored)} records not stored in {STORE_OUT_PATH}: "
+            f"{not_stored}"
+        )
 
     var_df.to_csv(VARS_FILE_NAME)
 
     fn = []
     sl = []
     slc = []
-    for f, s, c in lengths_array:
+    slv = []
+    for f, s, c, v in lengths_array:
         fn.append(f)
         sl.append(s)
         slc.append(c)
+        slv.append(v)
 
-    lengths_df = pd.DataFrame({"fname": fn, "OriginalLength": sl, "Length": slc})
+    lengths_df = pd.DataFrame(
+        {"fname": fn, "OriginalLength": sl, "Length": slc, "ValidLength": slv}
+    )
     lengths_df.to_csv(LENGTHS_FILE_NAME0)
     spio.savemat(
         LENGTHS_FILE_NAME1,
@@ -300,6 +329,35 @@ def parseDataBase(fnames=None, n_start=None, nfiles=None, disableTqdm=False):
     )
 
 
+@ray.remote
+def parseRecordOutputs(fname, outputs):
+    # un registro con problemas (ej. falta un canal) no cancela la corrida
+    try:
+        return evaluateRecord(getRecordGraph(fname), outputs)
+    except Exception as e:
+        logging.error(f"file {fname} not parsed: {e!r}")
+        return None
+
+
+def parseDataBaseOutputs(outputs, fnames=None, disableTqdm=False):
+    """
+    Calcula solo las salidas pedidas (ej. ["sleepTarget2", "cal_ahi_a0h4"])
+    para cada registro, sin escribir .mat. Devuelve {fname: {salida: valor}},
+    los registros que fallan se registran en el log y no se incluyen.
+    """
+    if fnames is None:
+        inventory = loadInventory(ROOT_PATH, cohorts=[COHORT])
+        fnames = selectRecords(inventory, COHORT)
+    fnames = sorted(fnames)
+    ids = [parseRecordOutputs.remote(fn, outputs) for fn in fnames]
+    results = {}
+    for fn, id in tqdm(zip(fnames, ids), total=len(ids), disable=disableTqdm):
+        out = ray.get(id)
+        if out is not None:
+            results[fn] = out
+    return results
+
+
 if __name__ == "__main__":
     logging.warning(f"pid: {os.getpid()}")
     parseDataBase()
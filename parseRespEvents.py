@@ -40,6 +40,51 @@ RESP_EVENTS_MAP_DEFAULT = {
 }
 # La desaturación corresponde al evento respiratorio 30 muestras atras
 DESATURATION_MARK_OFFSET = 30
+HYPOPNEA_EVENTS = ['Hypopnea']
+APNEA_EVENTS = ['Obstructive apnea', 'Central Apnea', 'Mixed Apnea']
+
+
+def getAHRespMap(threshold):
+    '''
+    Mapa de apneas e hipopneas (con desaturación >= threshold) para el
+    cálculo del AHI
+    '''
+    return {
+        'targetName':
+        'resp_ahi',
+        'maps': [
+            {
+                'map': 1,
+                'event': HYPOPNEA_EVENTS,
+                'SpO2 desaturation': threshold
+            },
+            {
+                'map': 2,
+                'event': APNEA_EVENTS,
+                'SpO2 desaturation': None
+            },
+        ]
+    }
+
+
+def maskWakeEvents(ah_events, sleep_events):
+    '''
+    Elimina los eventos que comienzan en vigilia y enmascara con el sueño
+    '''
+    ah_events = ah_events.copy()
+    temp_ah_events = (ah_events > 0).astype(float)
+
+    # remove awake and partially awake events
+    ev_diff = np.diff(temp_ah_events)
+    mark_points = np.diff(temp_ah_events *
+                          (1 - sleep_events)) * np.abs(ev_diff)
+    for i in np.where(mark_points == 1)[0]:
+        try:
+            j = np.where(ev_diff[i + 1:] < 0)[0][0]
+            ah_events[i + 1:i + 2 + j] = 0
+        except IndexError:
+            pass
+    return ah_events * sleep_events
 
 
 def getDesaturation(xml_data, signal_length, threshold):
@@ -62,7 +107,9 @@ def getDesaturation(xml_data, signal_length, threshold):
                     desaturation[start:stop] = 1
         # match desaturation with resp event
         desaturation = np.roll(desaturation, -DESATURATION_MARK_OFFSET)
-        desaturation[-DESATURATION_MARK_OFFSET:] = 0
+        # con offset 0, [-0:] pondría en 0 toda la señal
+        if DESATURATION_MARK_OFFSET > 0:
+            desaturation[-DESATURATION_MARK_OFFSET:] = 0
     else:
         desaturation = np.ones(signal_length)
 
@@ -112,16 +159,38 @@ def getEvents(xml_data, signal_length, out_dict, respEventsMap):
     return out_dict
 
 
+def readRespEventsXml(xml_path, fname):
+    fname = f'{xml_path}/{fname}-nsrr.xml'
+    return pdx.read_xml(fname, XML_STRUC).iloc[0]
+
+
+def readXmlEvents(xml_data):
+    '''
+    Lista de eventos del xml (tipo, inicio, duración, caída de SpO2). La
+    caída es NaN salvo en las desaturaciones.
+    '''
+    xml_events = []
+    for i in range(xml_data.size):
+        b = xml_data.iloc[i]
+        drop = np.nan
+        if 'SpO2 desaturation' in b['EventConcept']:
+            drop = np.abs(float(b['SpO2Baseline']) - float(b['SpO2Nadir']))
+        xml_events.append((b['EventConcept'], float(b['Start']),
+                           float(b['Duration']), drop))
+    return xml_events
+
+
 def parseRespEvents(xml_path,
                     fname,
                     signal_length,
                     out_dict,
-                    respEventsMaps=None):
+                    respEventsMaps=None,
+                    xml_data=None):
 
     out_dict['respEventTargetMaps'] = [str(map) for map in respEventsMaps]
-    # read xml
-    fname = f'{xml_path}/{fname}-nsrr.xml'
-    xml_data = pdx.read_xml(fname, XML_STRUC).iloc[0]
+    # read xml (si no se pasa ya leído)
+    if xml_data is None:
+        xml_data = readRespEventsXml(xml_path, fname)
     # parse all target maps
     for map in respEventsMaps:
         out_dict = getEvents(xml_data, signal_length, out_dict, map)
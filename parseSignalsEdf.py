@@ -33,8 +33,14 @@ from matplotlib.pyplot import plot
 from pyedflib import highlevel
 from scipy.interpolate import interp1d
 
+from edfHeader import fixEdfDate
+from signalsCache import getCacheKey, loadSignals, saveSignals
+
 # estados invalidos de OX Stat
 OXSTAT_STATES = [2, 3]
+# límites válidos de SaO2 y HR
+SAO2_BOUNDS = (40, 130)
+HR_BOUNDS = (40, 110)
 logger = logging.getLogger(__name__)
 
 
@@ -53,6 +59,15 @@ def NanInterp(x):
     return x
 
 
+def cleanSignalName(s):
+    # remover paréntesis del nombre
+    s = re.sub('\(.*?\)', '()', s)
+    # MATLAB no acepta . o espacio en nombre de variable
+    for a in ['.', ' ', '(', ')']:
+        s = s.replace(a, '')
+    return s
+
+
 def getSignalsMap(signal_headers, signalsNames, fileID):
     signalsMap = {}
     empty_signal = False
@@ -65,11 +80,7 @@ def getSignalsMap(signal_headers, signalsNames, fileID):
             logger.info(f"file {fileID} not parsed, doesn't have {s} signal.")
             # print(f"ERROR: file don't have {s} signal.")
 
-        # remover paréntesis del nombre
-        s = re.sub('\(.*?\)', '()', s)
-        # MATLAB no acepta . o espacio en nombre de variable
-        for a in ['.', ' ', '(', ')']:
-            s = s.replace(a, '')
+        s = cleanSignalName(s)
         if empty_signal:
             signalsMap[s] = None
         else:
@@ -96,7 +107,7 @@ def SaO2_correction(out_dict):
         2: mal funcionamiento
         3: funcionamiento mediocre
     '''
-    LOWER_BOUND, UPPER_BOUND = 40, 130
+    LOWER_BOUND, UPPER_BOUND = SAO2_BOUNDS
     Oxstat = out_dict['OXstat']
     SaO2 = out_dict['SaO2']
     # NaN en SaO2 donde OxStat = 2 o 3
@@ -118,7 +129,7 @@ def HR_correction(out_dict):
     '''Enmascara la señal HR con la información de OxStat y con la misma HR,
     luego interpola linealmente entre las muestras adyacente.
     '''
-    LOWER_BOUND, UPPER_BOUND = 40, 110
+    LOWER_BOUND, UPPER_BOUND = HR_BOUNDS
     Oxstat = out_dict['OXstat']
     HR = out_dict['HR']
     # NaN en HR donde OxStat = 2 o 3
@@ -135,8 +146,26 @@ def HR_correction(out_dict):
     return out_dict
 
 
-def parseSignalsEdf(edf_path, fname, out_dict, signalsNames=None):
+def parseSignalsEdf(edf_path,
+                    fname,
+                    out_dict,
+                    signalsNames=None,
+                    cache_path=None,
+                    fix_date=True):
     fname = f'{edf_path}/{fname}.edf'
+    # corregir la fecha de inicio (pyedflib no lee 00.00.00)
+    if fix_date:
+        fixEdfDate(fname)
+    # buscar señales ya decodificadas en la cache (solo con canales fijos)
+    use_cache = cache_path is not None and signalsNames is not None
+    if use_cache:
+        # la corrección forma parte de la clave: si cambia, se recalcula
+        key = getCacheKey(fname, signalsNames,
+                          [OXSTAT_STATES, SAO2_BOUNDS, HR_BOUNDS])
+        signals, signal_lenght = loadSignals(cache_path, key)
+        if signals is not None:
+            out_dict.update(signals)
+            return out_dict, signal_lenght
     # read edf file
     signals, signal_headers, header = highlevel.read_edf(fname)
     # obtener todas las señales del edf
@@ -151,6 +180,10 @@ def parseSignalsEdf(edf_path, fname, out_dict, signalsNames=None):
     if not out_dict['error']:
         out_dict = SaO2_correction(out_dict)
         out_dict = HR_correction(out_dict)
+        if use_cache:
+            saveSignals(cache_path, key,
+                        {s: out_dict[s]
+                         for s in signalsMap}, signal_lenght)
     return out_dict, signal_lenght
 
 
@@ -23,6 +23,14 @@ from matplotlib.pyplot import plot
 
 CSV_SEP = ','
 EPOCH_DURATION = 30
+# sueño/vigilia para el cálculo del AHI
+AH_SLEEP_MAP = {
+    'targetName': 'sleep_ahi',
+    'map': {
+        '0': [0, 6],
+        '1': [1, 2, 3, 4, 5],
+    }
+}
 
 
 def correctState9(target):
@@ -35,13 +43,11 @@ def correctState9(target):
     return target
 
 
-def parseSleepStages(csv_path,
-                     fname,
-                     signal_length,
-                     out_dict,
-                     sleepStagesMaps=None):
-    # read file
-    out_dict['sleepStagesTargetMaps'] = [str(map) for map in sleepStagesMaps]
+def readSleepStages(csv_path, fname, signal_length):
+    '''
+    Lee el staging y devuelve los estados muestra a muestra y el tiempo total
+    de sueño (minutos)
+    '''
     fname = f'{csv_path}/{fname}-staging.csv'
     df = pd.read_csv(fname, sep=CSV_SEP, index_col=0)
     data_stages = df['Stage']
@@ -54,7 +60,7 @@ def parseSleepStages(csv_path,
     data_stages = correctState9(data_stages)
     # calcular tiempo total de sueño (minutos)
     inds_sleep = np.logical_or(data_stages == 0, data_stages == 6)
-    out_dict['tst'] = np.sum(~inds_sleep) / 2
+    tst = np.sum(~inds_sleep) / 2
 
     # parse all stages in file
     target_xml = np.zeros(signal_length)
@@ -62,18 +68,33 @@ def parseSleepStages(csv_path,
     for stage in data_stages:
         target_xml[ind:ind + EPOCH_DURATION] = stage
         ind += EPOCH_DURATION
+    return target_xml, tst
+
+
+def mapSleepStages(target_xml, st_map):
+    target = target_xml.copy()
+    for map, vals in st_map['map'].items():
+        inds = np.isin(target, vals)
+        target[inds] = int(map)
+    return target
+
+
+def parseSleepStages(csv_path,
+                     fname,
+                     signal_length,
+                     out_dict,
+                     sleepStagesMaps=None):
+    # read file
+    out_dict['sleepStagesTargetMaps'] = [str(map) for map in sleepStagesMaps]
+    target_xml, out_dict['tst'] = readSleepStages(csv_path, fname,
+                                                  signal_length)
     # map stages
     if sleepStagesMaps is not None:
         for st_map in sleepStagesMaps:
-            target = target_xml.copy()
-            targetName = st_map['targetName']
-            for map, vals in st_map['map'].items():
-                inds = np.isin(target, vals)
-                target[inds] = int(map)
-            out_dict[targetName] = target
+            out_dict[st_map['targetName']] = mapSleepStages(target_xml, st_map)
     else:
         targetName = 'sleepDefaultTarget'
-        out_dict[targetName] = target
+        out_dict[targetName] = target_xml.copy()
     return out_dict, target_xml
 
 
@@ -15,6 +15,8 @@ import logging
 import numpy as np
 import pandas as pd
 
+from subjectID import getSubjectID
+
 CSV_SEP = ','
 DEFAUL_VARIABLES = ['ahi_a0h4a', 'ahi_a0h3', 'SlpPrdP']
 VARIABLES = [
@@ -23,19 +25,25 @@ VARIABLES = [
 ]
 
 
-def parseVariables(csv_file, signalID, out_dict, variables=None):
+def readVariablesRow(csv_file, signalID):
 
     # get file ID (index in csv)
-    id = int(signalID.split('-')[1])
+    id = getSubjectID(signalID)
 
     # read file
     df = pd.read_csv(csv_file, sep=CSV_SEP, index_col=0)
+    return df.loc[id]
+
+
+def parseVariables(csv_file, signalID, out_dict, variables=None):
+
+    row = readVariablesRow(csv_file, signalID)
     if variables is None:
         variables = DEFAUL_VARIABLES
 
     # parse variables
     for v in variables:
-        out_dict[v] = df.loc[id, v]
+        out_dict[v] = row[v]
 
     return out_dict
 
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+record outputs graph
+
+Cada salida de un registro (señales, targets, AHI, variables, variables de
+oximetría) es un nodo con sus dependencias y la función que lo calcula. Se
+evalúan solo los nodos necesarios para las salidas pedidas y cada resultado
+intermedio (xml, staging, máscara de sueño, ...) se calcula una sola vez por
+registro.
+"""
+
+import numpy as np
+
+from edfHeader import readEdfHeader
+from oximetryFeatures import oximetryFeatures
+from parseRespEvents import (getAHRespMap, getEvents, maskWakeEvents,
+                             readRespEventsXml)
+from parseSignalsEdf import cleanSignalName, parseSignalsEdf
+from parseSleepStages import AH_SLEEP_MAP, mapSleepStages, readSleepStages
+from parseVariables import readVariablesRow
+
+AHI_THRESHOLDS = [4, 3]
+
+
+def buildRecordGraph(fname,
+                     paths,
+                     signalsNames,
+                     sleepStagesMaps,
+                     respEventsMaps,
+                     variables,
+                     ahiThresholds=None,
+                     oximetryThresholds=None):
+    '''
+    Devuelve {nombre: (dependencias, función, es_salida)}. paths tiene las
+    carpetas edf, staging, xml, el archivo de variables y la cache de señales
+    (cache). Los nodos que no son salida son resultados intermedios (xml,
+    staging, máscara de sueño del AHI, ...).
+    '''
+    if ahiThresholds is None:
+        ahiThresholds = AHI_THRESHOLDS
+    graph = {}
+
+    def add(name, deps, fn, output=True):
+        graph[name] = (deps, fn, output)
+
+    # señales: el largo se lee del header, sin decodificar el edf
+    add('signalLength', [],
+        lambda: readEdfHeader(f"{paths['edf']}/{fname}.edf")['signal_length'],
+        output=False)
+
+    def signals():
+        # error = True si falta algún canal
+        out_dict, _ = parseSignalsEdf(paths['edf'],
+                                      fname,
+                                      out_dict={
+                                          'fileID': fname,
+                                          'error': False
+                                      },
+                                      signalsNames=signalsNames,
+                                      cache_path=paths.get('cache'))
+        return out_dict
+
+    def signal(sig, s):
+        if sig['error']:
+            raise ValueError(f'file {fname}: missing signals.')
+        return sig[s]
+
+    add('signals', [], signals, output=False)
+    for s in signalsNames:
+        s = cleanSignalName(s)
+        add(s, ['signals'], lambda sig, s=s: signal(sig, s))
+
+    # sleep stages
+    add('sleepStages', ['signalLength'],
+        lambda sl: readSleepStages(paths['staging'], fname, sl),
+        output=False)
+    add('tst', ['sleepStages'], lambda st: st[1])
+    for st_map in sleepStagesMaps + [AH_SLEEP_MAP]:
+        add(st_map['targetName'], ['sleepStages'],
+            lambda st, st_map=st_map: mapSleepStages(st[0], st_map),
+            output=st_map is not AH_SLEEP_MAP)
+
+    # respiratory events
+    add('xml', [], lambda: readRespEventsXml(paths['xml'], fname),
+        output=False)
+    for map in respEventsMaps:
+        add(map['targetName'], ['xml', 'signalLength'],
+            lambda xml, sl, map=map: getEvents(xml, sl, {}, map)[map[
+                'targetName']])
+
+    # variables
+    add('variablesRow', [],
+        lambda: readVariablesRow(paths['variables'], fname),
+        output=False)
+    # SlpPrdP se necesita para el AHI aunque no se pida como variable
+    extra = [] if 'SlpPrdP' in variables else ['SlpPrdP']
+    for v in variables + extra:
+        add(v, ['variablesRow'],
+            lambda row, v=v: row[v],
+            output=v in variables)
+
+    # AHI
+    for th in ahiThresholds:
+        add(f'resp_ahi_th{th}', ['xml', 'signalLength'],
+            lambda xml, sl, th=th: getEvents(xml, sl, {}, getAHRespMap(th))[
+                'resp_ahi'],
+            output=False)
+        add(f'targetAH_th{th}_masked_sleep',
+            [f'resp_ahi_th{th}', 'sleep_ahi'], maskWakeEvents)
+        add(f'cal_ahi_a0h{th}', [f'targetAH_th{th}_masked_sleep', 'SlpPrdP'],
+            lambda ah, SlpPrd: 60 * (np.diff(ah) > 0).sum() / SlpPrd)
+
+    # oximetry features
+    if oximetryThresholds is not None:
+        add('oximetryFeatures', ['SaO2', 'sleep_ahi', 'tst', 'xml'],
+            lambda SaO2, sleep, tst, xml: oximetryFeatures(
+                SaO2, sleep == 1, tst, xml, oximetryThresholds),
+            output=False)
+        names = ['t90', 'spo2Nadir', 'desatBurden']
+        for th in oximetryThresholds:
+            names += [f'odi{th:g}', f'odi{th:g}_xml', f'odi{th:g}_xmlAgreement']
+        for n in names:
+            add(n, ['oximetryFeatures'], lambda f, n=n: f[n])
+
+    return graph
+
+
+def getRecordOutputs(graph):
+    '''
+    Nombres de todas las salidas del registro (sin los intermedios)
+    '''
+    return [name for name, (_, _, output) in graph.items() if output]
+
+
+def evaluateRecord(graph, outputs, memo=None):
+    '''
+    Calcula solo las salidas pedidas y sus dependencias. memo guarda los
+    resultados ya calculados, se puede reusar entre llamadas del mismo
+    registro.
+    '''
+    if memo is None:
+        memo = {}
+
+    def get(name):
+        if name not in memo:
+            if name not in graph:
+                raise ValueError(f'unknown output {name}.')
+            deps, fn, _ = graph[name]
+            memo[name] = fn(*[get(d) for d in deps])
+        return memo[name]
+
+    return {o: get(o) for o in outputs}
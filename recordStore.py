@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+record store
+
+Formato del almacenamiento que escribe recordTransport.RecordWriter: un
+archivo binario por array ({nombre}.bin) y un índice (index.csv) con fileID,
+nombre, dtype, shape y offset en bytes. La lectura no depende de ray, así el
+muestreo de ventanas (windowSampler) puede leer el almacenamiento.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+CSV_SEP = ','
+INDEX_FILE = 'index.csv'
+INDEX_COLUMNS = ['fileID', 'name', 'dtype', 'shape', 'offset']
+
+
+def readStoreIndex(out_path):
+    '''
+    Índice del almacenamiento, indexado por (fileID, nombre)
+    '''
+    index = pd.read_csv(f'{out_path}/{INDEX_FILE}', sep=CSV_SEP)
+    return index.set_index(['fileID', 'name']).sort_index()
+
+
+def loadStoredArray(out_path, fileID, name, index=None):
+    '''
+    Lee con memmap un array guardado por el escritor. index es el de
+    readStoreIndex, se lee si no se pasa. KeyError si el array no existe.
+    '''
+    if index is None:
+        index = readStoreIndex(out_path)
+    row = index.loc[(fileID, name)]
+    return np.memmap(f'{out_path}/{name}.bin',
+                     dtype=np.dtype(row['dtype']),
+                     mode='r',
+                     offset=int(row['offset']),
+                     shape=tuple(json.loads(row['shape'])))
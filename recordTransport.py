@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+record transport
+
+Los workers copian los arrays de cada registro a un bloque de memoria
+compartida (multiprocessing.shared_memory) y devuelven solo un descriptor
+(nombre del bloque, dtype, shape y offset de cada array). Un único proceso
+escritor (actor de ray) lee los arrays del bloque sin copiarlos, los agrega
+en orden al almacenamiento de salida y libera el bloque.
+
+Almacenamiento: un archivo binario por array ({nombre}.bin) y un índice
+(index.csv) con fileID, nombre, dtype, shape y offset en bytes, de modo que
+cada array se puede leer con memmap (recordStore.loadStoredArray).
+"""
+
+import json
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+import ray
+
+from recordStore import CSV_SEP, INDEX_COLUMNS, INDEX_FILE
+
+# alineación de cada array dentro del bloque (bytes)
+ALIGNMENT = 64
+
+
+def createSharedMemory(size):
+    try:
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+    except TypeError:
+        # python < 3.13: el resource tracker del worker liberaría el bloque
+        # al terminar el proceso, lo libera el escritor
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def attachSharedMemory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def putRecord(fileID, arrays):
+    '''
+    Copia los arrays a un bloque de memoria compartida y devuelve el
+    descriptor del registro
+    '''
+    layout = []
+    size = 0
+    for name, val in arrays.items():
+        val = np.ascontiguousarray(val)
+        layout.append((name, val.dtype.str, val.shape, size))
+        size += -(-val.nbytes // ALIGNMENT) * ALIGNMENT
+
+    shm = createSharedMemory(max(size, 1))
+    for (name, dtype, shape, offset) in layout:
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf,
+                   offset=offset)[...] = arrays[name]
+    descriptor = {'fileID': fileID, 'shm': shm.name, 'layout': layout}
+    shm.close()
+    return descriptor
+
+
+def getRecord(descriptor):
+    '''
+    Devuelve el bloque y los arrays del registro (vistas sobre el bloque, sin
+    copia). Los arrays no se pueden usar después de cerrar el bloque.
+    '''
+    shm = attachSharedMemory(descriptor['shm'])
+    arrays = {
+        name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        for (name, dtype, shape, offset) in descriptor['layout']
+    }
+    return shm, arrays
+
+
+def releaseRecord(shm):
+    shm.close()
+    shm.unlink()
+
+
+@ray.remote
+class RecordWriter:
+    '''
+    Proceso escritor: agrega los registros en el orden de los descriptores
+    recibidos y libera los bloques de memoria compartida.
+    '''
+
+    def __init__(self, out_path):
+        os.makedirs(out_path, exist_ok=True)
+        self.out_path = out_path
+        self.files = {}
+        self.index = []
+
+    def append(self, descriptor):
+        shm, arrays = getRecord(descriptor)
+        try:
+            self.write(descriptor['fileID'], arrays)
+        finally:
+            # las vistas sobre el bloque se liberan antes de cerrarlo, el
+            # bloque se libera aunque falle la escritura
+            arrays.clear()
+            releaseRecord(shm)
+
+    def write(self, fileID, arrays):
+        # el registro se agrega al índice solo si se escribieron todos sus
+        # arrays
+        rows = []
+        for name, val in arrays.items():
+            if name not in self.files:
+                self.files[name] = open(f'{self.out_path}/{name}.bin', 'wb')
+            f = self.files[name]
+            rows.append({
+                'fileID': fileID,
+                'name': name,
+                'dtype': val.dtype.str,
+                'shape': json.dumps(list(val.shape)),
+                'offset': f.tell(),
+            })
+            f.write(val.data)
+        self.index += rows
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        index = pd.DataFrame(self.index, columns=INDEX_COLUMNS)
+        index.to_csv(f'{self.out_path}/{INDEX_FILE}', sep=CSV_SEP, index=False)
+        return len(self.index)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+cache of decoded edf signals
+
+Las señales ya corregidas (SaO2, HR, OXstat) se guardan como .npy en una
+carpeta por registro. La clave depende del path del edf, su tamaño, su mtime,
+la lista de canales y los parámetros de la corrección, de modo que un cambio
+en el edf o en la corrección invalida la entrada.
+Las entradas se cargan con memmap y se eliminan por LRU cuando la cache
+supera el tamaño máximo. Cada proceso lleva la cuenta del tamaño de la cache
+(una recorrida completa al inicio más lo que guarda) y solo vuelve a recorrerla
+cuando esa cuenta supera el máximo; lo que guardan otros workers se cuenta en
+la siguiente recorrida.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# 20 GB por defecto
+CACHE_MAX_BYTES = 20 * 1024**3
+INFO_FILE = 'info.json'
+# tamaño de la cache según este proceso {cache_path: bytes}
+cache_size = {}
+logger = logging.getLogger(__name__)
+
+
+def getCacheKey(edf_fname, signalsNames, params=None):
+    '''
+    Clave de la cache: path absoluto, tamaño y mtime del edf, lista de canales
+    y parámetros de la corrección de las señales
+    '''
+    st = os.stat(edf_fname)
+    key = json.dumps([
+        os.path.abspath(edf_fname), st.st_size, st.st_mtime_ns,
+        list(signalsNames), params
+    ])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def loadSignals(cache_path, key):
+    '''
+    Devuelve (signals, signal_length) si la clave está en la cache, si no
+    (None, None). Las señales se abren con memmap (solo lectura).
+    '''
+    entry = f'{cache_path}/{key}'
+    try:
+        with open(f'{entry}/{INFO_FILE}') as f:
+            info = json.load(f)
+        signals = {
+            s: np.load(f'{entry}/{s}.npy', mmap_mode='r')
+            for s in info['signals']
+        }
+        # marcar como usada recientemente (LRU)
+        os.utime(entry)
+    except (FileNotFoundError, ValueError):
+        # no existe o la eliminó otro worker
+        return None, None
+    return signals, info['signal_length']
+
+
+def saveSignals(cache_path, key, signals, signal_length,
+                max_bytes=CACHE_MAX_BYTES):
+    '''
+    Guarda las señales en la cache. Se escribe en una carpeta temporal y se
+    renombra, así varios workers pueden escribir la cache a la vez.
+    '''
+    os.makedirs(cache_path, exist_ok=True)
+    entry = f'{cache_path}/{key}'
+    if os.path.isdir(entry):
+        return
+    tmp_entry = tempfile.mkdtemp(dir=cache_path, prefix='.tmp-')
+    for s, val in signals.items():
+        np.save(f'{tmp_entry}/{s}.npy', np.asarray(val))
+    with open(f'{tmp_entry}/{INFO_FILE}', 'w') as f:
+        json.dump({
+            'signals': list(signals),
+            'signal_length': int(signal_length)
+        }, f)
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # otro worker guardó la misma entrada
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        return
+
+    # recorrer la cache solo al inicio y cuando se supera el máximo
+    if cache_path not in cache_size:
+        cache_size[cache_path] = evictCache(cache_path, max_bytes)
+    else:
+        cache_size[cache_path] += getEntrySize(entry)
+        if cache_size[cache_path] > max_bytes:
+            cache_size[cache_path] = evictCache(cache_path, max_bytes)
+
+
+def getEntrySize(entry):
+    return sum(f.stat().st_size for f in os.scandir(entry))
+
+
+def evictCache(cache_path, max_bytes=CACHE_MAX_BYTES):
+    '''
+    Elimina las entradas usadas hace más tiempo hasta que la cache ocupe
+    menos de max_bytes.
+    '''
+    entries = []
+    total = 0
+    for e in os.scandir(cache_path):
+        if not e.is_dir() or e.name.startswith('.'):
+            continue
+        try:
+            size = getEntrySize(e.path)
+            entries.append((e.stat().st_mtime, size, e.path))
+        except FileNotFoundError:
+            continue
+        total += size
+
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info(f'cache entry {path} evicted.')
+        total -= size
+    return total
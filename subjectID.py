@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+subject ID of a record
+"""
+
+
+def getSubjectID(fileID):
+    '''
+    shhs1-200001 -> 200001 (índice en el archivo de variables)
+    '''
+    return int(fileID.split('-')[1])
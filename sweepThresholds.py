@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+AHI threshold sweep
+
+Calcula el AHI de calc_ah_index para una grilla de umbrales de desaturación
+(SpO2 desaturation) y de DESATURATION_MARK_OFFSET sin decodificar las señales:
+solo se leen el staging, el xml y el largo de la señal del header del edf.
+Todos los puntos de la grilla se evalúan juntos (un array por punto) y el
+resultado es una tabla sujeto x parámetros.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+import ray
+from tqdm import tqdm
+
+from cohortInventory import getRecordPaths, loadInventory, selectRecords
+from edfHeader import readEdfHeader
+from parseRespEvents import (APNEA_EVENTS, HYPOPNEA_EVENTS, readRespEventsXml,
+                             readXmlEvents)
+from parseSleepStages import AH_SLEEP_MAP, parseSleepStages
+from subjectID import getSubjectID
+
+CSV_SEP = ','
+logger = logging.getLogger(__name__)
+
+
+def getEventsMask(xml_events, signal_length, events):
+    mask = np.zeros(signal_length)
+    for (ev_type, ev_start, ev_duration, _) in xml_events:
+        if any(s in ev_type for s in events):
+            start = int(np.round(ev_start))
+            stop = int(np.round(ev_start + ev_duration))
+            mask[start:stop] = 1
+    return mask
+
+
+def getDesaturationMasks(xml_events, signal_length, thresholds, offsets):
+    '''
+    Máscaras de desaturación (n_thresholds, n_offsets, signal_length), igual
+    que getDesaturation para cada umbral y desplazamiento. Los offsets deben
+    ser >= 0 (la desaturación se adelanta off muestras).
+    '''
+    desat = [(s, d, drop) for (ev_type, s, d, drop) in xml_events
+             if 'SpO2 desaturation' in ev_type]
+    masks = np.zeros((len(thresholds), signal_length))
+    for start, duration, drop in desat:
+        start_ = int(np.round(start))
+        stop_ = int(np.round(start + duration))
+        masks[:, start_:stop_] = np.maximum(
+            masks[:, start_:stop_], (drop >= np.asarray(thresholds))[:, None])
+
+    out = np.zeros((len(thresholds), len(offsets), signal_length))
+    for k, off in enumerate(offsets):
+        # np.roll(-off) con las últimas off muestras en 0
+        out[:, k, :signal_length - off] = masks[:, off:]
+    return out
+
+
+def removeWakeEvents(events, sleep):
+    '''
+    Versión vectorizada del filtrado de calc_ah_index: elimina los eventos
+    que comienzan en vigilia (salvo el que empieza en la primera muestra o
+    llega hasta el final del registro). events es (n, signal_length).
+    '''
+    active = events > 0
+    n, L = active.shape
+    padded = np.concatenate([np.zeros((n, 1), dtype=bool), active], axis=1)
+    rises = np.diff(padded.astype(np.int8), axis=1) > 0
+    # número de evento de cada muestra (0 fuera de eventos), único por fila
+    run_id = np.cumsum(rises, axis=1) * active
+    n_runs = rises.sum(axis=1)
+    row_offset = np.concatenate(([0], np.cumsum(n_runs)[:-1]))
+    run_id = np.where(active, run_id + row_offset[:, None], 0)
+
+    rows, starts = np.nonzero(rises)
+    ends = np.zeros(n_runs.sum(), dtype=int)
+    flat_ids = run_id[active] - 1
+    cols = np.nonzero(active)[1]
+    np.maximum.at(ends, flat_ids, cols)
+    drop = (starts > 0) & (sleep[starts] == 0) & (ends < L - 1)
+
+    drop = np.concatenate(([False], drop))
+    return np.where(drop[run_id], 0, events)
+
+
+@ray.remote
+def sweepFile(fname, paths, thresholds, offsets, SlpPrd=None):
+
+    signal_length = readEdfHeader(
+        f"{paths['edf']}/{fname}.edf")['signal_length']
+    od_, _ = parseSleepStages(paths['staging'],
+                              fname,
+                              signal_length=signal_length,
+                              out_dict={},
+                              sleepStagesMaps=[AH_SLEEP_MAP])
+    sleep = od_['sleep_ahi']
+    if SlpPrd is None:
+        SlpPrd = od_['tst']
+
+    xml_events = readXmlEvents(readRespEventsXml(paths['xml'], fname))
+    hypopnea = getEventsMask(xml_events, signal_length, HYPOPNEA_EVENTS)
+    apnea = getEventsMask(xml_events, signal_length, APNEA_EVENTS)
+    desat = getDesaturationMasks(xml_events, signal_length, thresholds,
+                                 offsets)
+
+    # targets de calc_ah_index (1: hipopnea con desaturación, 2: apnea)
+    events = (desat * hypopnea + 2 * apnea).reshape(-1, signal_length)
+    events = removeWakeEvents(events, sleep)
+    n_ah_events = (np.diff(events * sleep, axis=1) > 0).sum(axis=1)
+    return 60 * n_ah_events / SlpPrd
+
+
+def sweepThresholds(root_path,
+                    cohort,
+                    thresholds,
+                    offsets,
+                    fnames=None,
+                    variables_file=None,
+                    disableTqdm=False):
+    '''
+    Tabla de AHI (fileID x (umbral, offset)). Si se pasa variables_file el
+    AHI se normaliza con SlpPrdP, como calc_ah_index, si no con el tst del
+    staging.
+    '''
+    if any(off < 0 for off in offsets):
+        raise ValueError('offsets must be >= 0.')
+    paths = getRecordPaths(root_path, cohort)
+    if fnames is None:
+        inventory = loadInventory(root_path, cohorts=[cohort])
+        fnames = selectRecords(inventory, cohort, ('edf', 'staging', 'xml'))
+    SlpPrd = {fn: None for fn in fnames}
+    if variables_file is not None:
+        df = pd.read_csv(variables_file, sep=CSV_SEP, index_col=0)
+        SlpPrd = {fn: df.loc[getSubjectID(fn), 'SlpPrdP'] for fn in fnames}
+
+    ids = [
+        sweepFile.remote(fn, paths, thresholds, offsets, SlpPrd[fn])
+        for fn in fnames
+    ]
+    rows = [ray.get(id) for id in tqdm(ids, disable=disableTqdm)]
+
+    columns = pd.MultiIndex.from_product([thresholds, offsets],
+                                         names=['threshold', 'offset'])
+    return pd.DataFrame(rows,
+                        index=pd.Index(fnames, name='fileID'),
+                        columns=columns)
+
+
+if __name__ == "__main__":
+    ROOT_PATH = './data'
+    COHORT = 'shhs1'
+    ray.init(num_cpus=8)
+    ahi = sweepThresholds(ROOT_PATH,
+                          COHORT,
+                          thresholds=[2.0, 3.0, 4.0, 5.0],
+                          offsets=[0, 15, 30, 45],
+                          variables_file=getRecordPaths(ROOT_PATH,
+                                                        COHORT)['variables'])
+    ahi.to_csv(f'{ROOT_PATH}/ahi_sweep_{COHORT}.csv')
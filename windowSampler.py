@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SLEEP DATABASE PARSE
+windowed samples
+
+Iterador de ventanas de largo fijo sobre la salida de parseDataBase. Con
+sequenceLengths.mat y validSegments se arma un índice global de ventanas
+(registro, inicio); las ventanas se leen con memmap de los .npy de cada
+registro (NPY_OUT_PATH) o del almacenamiento agregado (STORE_OUT_PATH, con
+store=True), manteniendo abiertos solo los últimos arrays usados (LRU).
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import scipy.io as spio
+
+from recordStore import loadStoredArray, readStoreIndex
+
+SIGNALS = ['SaO2', 'HR']
+TARGETS = ['sleepTarget1', 'targetA0H4']
+
+
+def readSequenceLengths(lengths_file):
+    '''
+    Lee fname y sequenceLengths del archivo generado por parseDataBase
+    '''
+    data = spio.loadmat(lengths_file)
+    fnames = [str(f).strip() for f in data['fname']]
+    lengths = data['sequenceLengths'].astype(int).flatten()
+    return fnames, lengths
+
+
+def loadArray(npy_path, fname, name):
+    return np.load(f'{npy_path}/{fname}/{name}.npy', mmap_mode='r')
+
+
+def getArrayLoader(out_path, store=False):
+    '''
+    Función (fname, nombre) -> array con memmap, de los .npy de cada registro
+    o del almacenamiento (el índice se lee una sola vez)
+    '''
+    if not store:
+        return lambda fname, name: loadArray(out_path, fname, name)
+    index = readStoreIndex(out_path)
+    return lambda fname, name: loadStoredArray(out_path, fname, name, index)
+
+
+def buildWindowIndex(load, fnames, lengths, window, stride=None):
+    '''
+    Índice global de ventanas: array (n, 2) con (registro, inicio). Las
+    ventanas quedan dentro de los tramos válidos (validSegments) de cada
+    registro, si no existen se usa el registro completo. load es la función
+    de getArrayLoader.
+    '''
+    if stride is None:
+        stride = window
+    index = []
+    for i, (fn, sl) in enumerate(zip(fnames, lengths)):
+        try:
+            segments = np.asarray(load(fn, 'validSegments'))
+        except (FileNotFoundError, KeyError):
+            segments = np.array([[0, sl]])
+        for start, stop in segments.reshape(-1, 2):
+            starts = np.arange(start, stop - window + 1, stride)
+            index.append(np.stack([np.full(starts.size, i), starts], axis=1))
+    if len(index) == 0:
+        return np.zeros((0, 2), dtype=int)
+    return np.concatenate(index).astype(int)
+
+
+def iterWindows(out_path,
+                lengths_file,
+                window,
+                stride=None,
+                batch_size=32,
+                signals=None,
+                targets=None,
+                shuffle=True,
+                seed=None,
+                drop_last=False,
+                max_open_files=128,
+                store=False):
+    '''
+    Genera batches {nombre: array (batch, window)} con las señales y targets
+    pedidos, más fileID e inicio de cada ventana. out_path es la carpeta de
+    los .npy o, con store=True, la del almacenamiento de parseDataBase.
+    '''
+    if signals is None:
+        signals = SIGNALS
+    if targets is None:
+        targets = TARGETS
+    names = list(signals) + list(targets)
+
+    fnames, lengths = readSequenceLengths(lengths_file)
+    load = getArrayLoader(out_path, store)
+    index = buildWindowIndex(load, fnames, lengths, window, stride)
+    if shuffle:
+        index = index[np.random.default_rng(seed).permutation(len(index))]
+
+    # arrays abiertos (memmap), los menos usados se cierran
+    openArray = lru_cache(maxsize=max_open_files)(load)
+
+    for b in range(0, len(index), batch_size):
+        batch = index[b:b + batch_size]
+        if drop_last and len(batch) < batch_size:
+            break
+        out = {
+            n: np.stack([
+                openArray(fnames[i], n)[start:start + window]
+                for i, start in batch
+            ])
+            for n in names
+        }
+        out['fileID'] = [fnames[i] for i in batch[:, 0]]
+        out['start'] = batch[:, 1]
+        yield out
+
+
+if __name__ == "__main__":
+    ROOT_PATH = './data'
+    NPY_OUT_PATH = f'{ROOT_PATH}/npy/shhs1'
+    LENGTHS_FILE = f'{ROOT_PATH}/matlab/shhs1/sequenceLengths.mat'
+    # ventanas de 5 minutos
+    for batch in iterWindows(NPY_OUT_PATH, LENGTHS_FILE, window=300):
+        print(batch['fileID'][0], batch['SaO2'].shape)
+        break